@@ -1,213 +1,480 @@
 """
 Main script for running mentor matching
+
+The matching is computed by a pipeline of stages (load -> score -> build -> solve -> write), each of which is a
+function in this file, so other tooling can import this module and run whichever stages it needs.
+gurobipy is only imported by the stages that actually use the solver, so loading / validating / scoring data
+does not pay for it.
 """
 
 import utils
 from utils import Mentor, Team
+import argparse
 import csv
+import hashlib
 import sys
 
 import time # for testing purposes
 
-import gurobipy as gp
-
-
-print("Process started!  Reading mentor file...", flush = True)
-mentors = []
-with open("mentors.csv") as mentorFile:
-	mentorReader = csv.reader(mentorFile)
-	# remove header rows, if any
-	for _ in range(utils.mentorHeaderRows):
-		next(mentorReader) # just read the row and throw it away
-	for dataRow in mentorReader:
-		mentors.append(Mentor(dataRow)) # create a new mentor object based on each row of data
-
-print("Reading team file...", flush = True)
-teams = []
-with open("teams.csv") as teamFile:
-	teamReader = csv.reader(teamFile)
-	# remove header rows, if any
-	for _ in range(utils.teamHeaderRows):
-		next(teamReader) # throw out header rows
-	for dataRow in teamReader:
-		teams.append(Team(dataRow)) # create the team object
-
-print("Creating compatibility file...", flush = True)
-with open('compatibility.csv', 'w', newline = '') as compatFile:
-	compatWriter = csv.writer(compatFile)
-	firstRow = ['Name'] # first row is a header that gives the name of each team
-	for team in teams:
-		firstRow.append(team.name)
-	compatWriter.writerow(firstRow)
+
+# human-readable names for the solver statuses, indexed by status code
+solverStatusNames = ["N/A", "Not Yet Solved", "Optimum Found", "Infeasible", "Infeasible or Unbounded", "Unbounded", "Optimum Worse Than Cutoff",
+					"Iteration Limit Reached", "Node Limit Reached", "Time Limit Reached", "Solution Limit Reached", "Interrupted",
+					"Numerical Instability", "Suboptimal Solution", "Something About Asynchronus Stuff", "Objective Limit Reached"]
+
+
+"""
+Loading and validating data
+"""
+
+def readMentors(mentorPath):
+	"""
+	Reads the mentor file at mentorPath and returns a list of Mentor objects, one per (non-header) row
+	Will raise an exception if the data is not formatted correctly
+	"""
+	mentors = []
+	with open(mentorPath) as mentorFile:
+		mentorReader = csv.reader(mentorFile)
+		# remove header rows, if any
+		for _ in range(utils.mentorHeaderRows):
+			next(mentorReader) # just read the row and throw it away
+		for dataRow in mentorReader:
+			mentors.append(Mentor(dataRow)) # create a new mentor object based on each row of data
+	return mentors
+
+def readTeams(teamPath):
+	"""
+	Reads the team file at teamPath and returns a list of Team objects, one per (non-header) row
+	Will raise an exception if the data is not formatted correctly
+	"""
+	teams = []
+	with open(teamPath) as teamFile:
+		teamReader = csv.reader(teamFile)
+		# remove header rows, if any
+		for _ in range(utils.teamHeaderRows):
+			next(teamReader) # throw out header rows
+		for dataRow in teamReader:
+			teams.append(Team(dataRow)) # create the team object
+	return teams
+
+def loadData(mentorPath, teamPath):
+	"""
+	Reads both input files and returns (mentors, teams)
+	"""
+	print("Reading mentor file...", flush = True)
+	mentors = readMentors(mentorPath)
+	print("Reading team file...", flush = True)
+	teams = readTeams(teamPath)
+	return mentors, teams
+
+def getInputFingerprint(mentorPath, teamPath, *extra):
+	"""
+	Returns a hex string identifying the contents of the input files and every setting in utils (formats and weights)
+	Anything else that affects the result (eg the number of candidate co-mentors) can be passed in extra
+	Used to tell whether saved intermediate results can be reused
+	"""
+	fingerprint = hashlib.sha256()
+	for path in [mentorPath, teamPath]:
+		with open(path, 'rb') as inputFile:
+			fingerprint.update(inputFile.read())
+		fingerprint.update(b"\0")
+	settings = [(name, value) for name, value in sorted(vars(utils).items())
+				if not name.startswith("_") and isinstance(value, (int, float, str, list))]
+	fingerprint.update(repr(settings).encode())
+	fingerprint.update(repr(extra).encode())
+	return fingerprint.hexdigest()
+
+def validateData(mentors, teams):
+	"""
+	Checks the loaded data for problems that the row-by-row parsing in utils can't catch
+	Returns a list of human-readable descriptions of the problems found (empty if everything looks fine)
+	Names that don't match anything are usually typos in the spreadsheet; they won't stop the program from running, but the
+		corresponding request / requirement will silently be ignored
+	"""
+	problems = []
+
+	# duplicate names make requests ambiguous (and mentors with identical names never get type 4 variables)
+	for index, mentor in enumerate(mentors):
+		for otherMentor in mentors[index + 1:]:
+			if otherMentor.isMatch(mentor.name):
+				problems.append("Mentor name " + mentor.name + " appears more than once")
+	for index, team in enumerate(teams):
+		for otherTeam in teams[index + 1:]:
+			if otherTeam.isMatch(team.name):
+				problems.append("Team name " + team.name + " appears more than once")
+
+	# every name a mentor refers to should exist
 	for mentor in mentors:
-		mentorRow = [mentor.name] # contains the name of this mentor + compatibility for each team
-		for team in teams:
-			mentorRow.append(str(utils.getTeamCompatibility(mentor, team)))
-		compatWriter.writerow(mentorRow)
-print("Compatibilities output to compatibility.csv")
-
-print("Initializing model...", flush = True)
-m = gp.Model()
-
-print("Creating optimization variables...", flush = True)
-variables = [] # list of all variables
-varByType = {} # map from variable type to list of variables of that type
-varByMentor = {} # map from (variable type, mentor) to list of variables of that type for that mentor
-varByTeam = {} # map from (variable type, team) to list of variables of that type for that team
-varByPair = {} # map from (variable type, mentor, team) to list of variable of that type for that team and mentor
-groupByVar = {} # map from a variable to the (variable type, list of mentors, team) corresponding to it
-# initialize varByType, varByMentor, varByTeam, and varByPair with empty lists to prevent KeyErrors later
-for varType in [1, 2, 3, 4]:
-	varByType[varType] = []
+		for teamName in mentor.teamsRequested + mentor.teamsRequired:
+			if not any(team.isMatch(teamName) for team in teams):
+				problems.append(mentor.name + " refers to unknown team " + teamName)
+		for mentorName in mentor.mentorsRequested + mentor.mentorsRequired:
+			if mentor.isMatch(mentorName):
+				problems.append(mentor.name + " requests to be paired with themselves")
+			elif not any(otherMentor.isMatch(mentorName) for otherMentor in mentors):
+				problems.append(mentor.name + " refers to unknown mentor " + mentorName)
+
+	# type 1 and 2 constraints can only be satisfied if there are a reasonable number of mentors per team
+	if len(mentors) < len(teams) * utils.minNumMentors:
+		problems.append("Not enough mentors (" + str(len(mentors)) + ") to give each of the " + str(len(teams)) + " teams at least " + str(utils.minNumMentors))
+	if len(mentors) > len(teams) * utils.maxNumMentors:
+		problems.append("Too many mentors (" + str(len(mentors)) + ") to give each of the " + str(len(teams)) + " teams at most " + str(utils.maxNumMentors))
+
+	return problems
+
+
+"""
+Computing compatibility scores
+"""
+
+"""
+class holding the compatibility scores used as weights in the optimization problem
+mentors and teams are referred to by their index in the lists the scores were computed from
+attributes:
+	teamScores: teamScores[i][j] is the compatibility of mentors[i] with teams[j], independent of co-mentors
+	aloneScores: aloneScores[i][j] is the compatibility of mentors[i] with teams[j] if the mentor is alone
+	groupScores: map from (i1, i2, j) to the compatibility of the group mentors[i1], mentors[i2], teams[j]
+					contains exactly the groups that get a type 4 variable; i1 and i2 are ordered so that mentors[i1].name < mentors[i2].name
+					None if group scores were not computed
+	offset: the constant subtracted from the objective (type 4 term in the README)
+"""
+class Scores:
+	def __init__(self, teamScores, aloneScores, groupScores, offset):
+		self.teamScores = teamScores
+		self.aloneScores = aloneScores
+		self.groupScores = groupScores
+		self.offset = offset
+
+def getOrderedPairs(mentors):
+	"""
+	Returns a list of all (i1, i2) index pairs with mentors[i1].name < mentors[i2].name
+	This is the set of mentor pairs that the program considers for type 4 variables
+	"""
+	pairs = []
+	for i1, mentor1 in enumerate(mentors):
+		for i2, mentor2 in enumerate(mentors):
+			if mentor1.name >= mentor2.name:
+				continue # only consider each pair once, don't consider groups where mentor1 and mentor2 are the same
+			pairs.append((i1, i2))
+	return pairs
+
+def getRequirementOffset(mentors, teams):
+	"""
+	Returns the constant offset subtracted from the objective function so that solutions that don't satisfy all requirements have a negative value
+	"""
+	numMentorReqs = 0 # how many pairs of mentors are required to be paired
+	for mentor1 in mentors:
+		for mentor2 in mentors:
+			if mentor1.name >= mentor2.name:
+				continue # only consider each pair once, don't consider a mentor with themselves
+			if mentor1.mustPair(mentor2) or mentor2.mustPair(mentor1):
+				numMentorReqs += 1
+	numTeamReqs = 0 # how many mentors must be paired with a team
 	for mentor in mentors:
-		varByMentor[(varType, mentor)] = []
 		for team in teams:
-			varByPair[(varType, mentor, team)] = []
-	for team in teams:
-		varByTeam[(varType, team)] = []
-# create variables of type 1 and 3 (one per mentor-team pair)
-for varType in [1, 3]:
-	for mentor in mentors:
+			if team.mustAssign(mentor):
+				numTeamReqs += 1
+				break # make sure we don't count this mentor twice if they have multiple required teams
+	return (numMentorReqs * utils.mentorRequiredValue) + (numTeamReqs * utils.teamRequiredValue)
+
+def computeScores(mentors, teams, includeGroups = True, candidateGroups = None):
+	"""
+	Computes all the compatibility scores needed to build the optimization problem and returns them as a Scores object
+	If includeGroups is False, the (expensive) mentor-mentor-team scores are skipped and groupScores is None
+	If candidateGroups is given (eg by candidates.getCandidateGroups), only those (i1, i2, j) groups are scored, and so only they
+		get type 4 variables; otherwise every group is
+	"""
+	print("Computing compatibilities...", flush = True)
+	teamScores = [[utils.getTeamCompatibility(mentor, team) for team in teams] for mentor in mentors]
+	aloneScores = [[utils.getAloneCompatibility(mentor, team) for team in teams] for mentor in mentors]
+	groupScores = None
+	if includeGroups:
+		groupScores = {}
+		if candidateGroups is None:
+			candidateGroups = [(i1, i2, j) for i1, i2 in getOrderedPairs(mentors) for j in range(len(teams))]
+		else:
+			candidateGroups = sorted(candidateGroups) # so the model is built in the same order every time
+		for i1, i2, j in candidateGroups:
+			groupScores[(i1, i2, j)] = utils.getGroupCompatibility(mentors[i1], mentors[i2], teams[j])
+	return Scores(teamScores, aloneScores, groupScores, getRequirementOffset(mentors, teams))
+
+def evaluateMatching(mentors, teams, scores, teamByMentor):
+	"""
+	Returns the objective value the optimization problem gives the matching teamByMentor (a map from mentor to team)
+	Type 4 variables are only worth setting when their score is positive, so only positive group scores are counted
+	If scores.groupScores is None, the scores of the groups the matching uses are computed as needed (as if every group were modeled)
+	"""
+	teamIndex = {team: j for j, team in enumerate(teams)}
+	membersByTeam = [[] for _ in teams] # indices of the mentors assigned to each team
+	value = -scores.offset
+	for i, mentor in enumerate(mentors):
+		j = teamIndex[teamByMentor[mentor]]
+		membersByTeam[j].append(i)
+		value += scores.teamScores[i][j]
+	for j, members in enumerate(membersByTeam):
+		if len(members) == 1:
+			value += scores.aloneScores[members[0]][j]
+		for position, i1 in enumerate(members):
+			for i2 in members[position + 1:]:
+				if scores.groupScores is None:
+					groupScore = 0
+					if mentors[i1].name != mentors[i2].name: # mentors with the same name never share a type 4 variable
+						groupScore = utils.getGroupCompatibility(mentors[i1], mentors[i2], teams[j])
+				else:
+					groupScore = scores.groupScores.get((i1, i2, j), scores.groupScores.get((i2, i1, j), 0))
+				value += max(groupScore, 0)
+	return value
+
+def writeCompatibility(compatPath, mentors, teams, scores):
+	"""
+	Writes the mentor-team compatibility matrix to compatPath
+	"""
+	with open(compatPath, 'w', newline = '') as compatFile:
+		compatWriter = csv.writer(compatFile)
+		firstRow = ['Name'] # first row is a header that gives the name of each team
 		for team in teams:
-			newVar = m.addVar(vtype = gp.GRB.BINARY)
-			m.update() # needed to ensure that the variable we just created can be used as a key in the groupByVar dictionary
-			variables.append(newVar)
-			varByType[varType].append(newVar)
-			varByMentor[(varType, mentor)].append(newVar)
-			varByTeam[(varType, team)].append(newVar)
-			varByPair[(varType, mentor, team)].append(newVar)
-			groupByVar[newVar] = (varType, [mentor], team)
-# create variables of type 2 (one per team)
-for team in teams:
-	newVar = m.addVar(vtype = gp.GRB.BINARY)
-	m.update() # needed to ensure that the variable we just created can be used as a key in the groupByVar dictionary
-	variables.append(newVar)
-	varByType[2].append(newVar)
-	varByTeam[(2, team)].append(newVar)
-	groupByVar[newVar] = (2, [], team)
-#create variables of type 4 (one per mentor-mentor-team group)
-for mentor1 in mentors:
-	for mentor2 in mentors:
-		if mentor1.name >= mentor2.name:
-			continue # only consider each pair once, don't consider groups where mentor1 and mentor2 are the same
+			firstRow.append(team.name)
+		compatWriter.writerow(firstRow)
+		for i, mentor in enumerate(mentors):
+			mentorRow = [mentor.name] # contains the name of this mentor + compatibility for each team
+			for j in range(len(teams)):
+				mentorRow.append(str(scores.teamScores[i][j]))
+			compatWriter.writerow(mentorRow)
+	print("Compatibilities output to " + compatPath)
+
+
+"""
+Building and solving the optimization problem
+"""
+
+"""
+class holding a built optimization problem, along with the bookkeeping needed to read a matching back out of it
+attributes:
+	model: the gurobipy model
+	variables: list of all variables
+	varByType: map from variable type to list of variables of that type
+	varByMentor: map from (variable type, mentor) to list of variables of that type for that mentor
+	varByTeam: map from (variable type, team) to list of variables of that type for that team
+	varByPair: map from (variable type, mentor, team) to list of variable of that type for that team and mentor
+	groupByVar: map from a variable to the (variable type, list of mentors, team) corresponding to it
+	mentors, teams: the lists of mentors and teams the problem was built from
+	solution: after solving, the value of every variable in the order of model.getVars() (None before solving / if no solution was found)
+"""
+class Problem:
+	def __init__(self, model, mentors, teams):
+		self.model = model
+		self.mentors = mentors
+		self.teams = teams
+		self.variables = []
+		self.varByType = {}
+		self.varByMentor = {}
+		self.varByTeam = {}
+		self.varByPair = {}
+		self.groupByVar = {}
+		self.solution = None
+
+def buildModel(mentors, teams, scores):
+	"""
+	Creates the variables, constraints, and objective function of the optimization problem (see the README for a description)
+	Type 4 variables are created for exactly the groups in scores.groupScores
+	Returns a Problem object
+	"""
+	import gurobipy as gp
+
+	print("Initializing model...", flush = True)
+	m = gp.Model()
+	problem = Problem(m, mentors, teams)
+	variables = problem.variables
+	varByType = problem.varByType
+	varByMentor = problem.varByMentor
+	varByTeam = problem.varByTeam
+	varByPair = problem.varByPair
+	groupByVar = problem.groupByVar
+
+	print("Creating optimization variables...", flush = True)
+	# initialize varByType, varByMentor, varByTeam, and varByPair with empty lists to prevent KeyErrors later
+	for varType in [1, 2, 3, 4]:
+		varByType[varType] = []
+		for mentor in mentors:
+			varByMentor[(varType, mentor)] = []
+			for team in teams:
+				varByPair[(varType, mentor, team)] = []
 		for team in teams:
-			newVar = m.addVar(vtype = gp.GRB.BINARY)
-			m.update() # needed to ensure that the variable we just created can be used as a key in the groupByVar dictionary
-			variables.append(newVar)
-			varByType[4].append(newVar)
-			varByMentor[(4, mentor1)].append(newVar)
-			varByMentor[(4, mentor2)].append(newVar)
-			varByTeam[(4, team)].append(newVar)
-			varByPair[(4, mentor1, team)].append(newVar)
-			varByPair[(4, mentor2, team)].append(newVar)
-			groupByVar[newVar] = (4, [mentor1, mentor2], team)
-
-print("Creating constraints...", flush = True)
-constraints = []
-# create type 1 constraints
-for mentor in mentors:
-	typeOneVars = varByMentor[(1, mentor)]
-	constraints.append(sum(typeOneVars) == 1)
-# create type 2 constraints
-for team in teams:
-	typeOneVars = varByTeam[(1, team)]
-	constraints.append(sum(typeOneVars) >= utils.minNumMentors)
-	constraints.append(sum(typeOneVars) <= utils.maxNumMentors)
-# create type 3 and 4 constraints
-M = len(mentors)
-for team in teams:
-	typeTwoVar = varByTeam[(2, team)][0] # will only have a single variable in the list, so extract it
-	typeOneVars = varByTeam[(1, team)]
-	constraints.append(M * typeTwoVar <= M + 1 - sum(typeOneVars)) # type 3
-	constraints.append(typeTwoVar >= 2 - sum(typeOneVars)) # type 4
-# create type 5 constraints
-for team in teams:
-	typeTwoVar = varByTeam[(2, team)][0] # will only have a single variable in the list, so extract it
-	typeThreeVars = varByTeam[(3, team)]
-	constraints.append(sum(typeThreeVars) == typeTwoVar)
-# create type 6 constraints
-for mentor in mentors:
+			varByTeam[(varType, team)] = []
+	# create variables of type 1 and 3 (one per mentor-team pair)
+	for varType in [1, 3]:
+		for mentor in mentors:
+			for team in teams:
+				newVar = m.addVar(vtype = gp.GRB.BINARY)
+				m.update() # needed to ensure that the variable we just created can be used as a key in the groupByVar dictionary
+				variables.append(newVar)
+				varByType[varType].append(newVar)
+				varByMentor[(varType, mentor)].append(newVar)
+				varByTeam[(varType, team)].append(newVar)
+				varByPair[(varType, mentor, team)].append(newVar)
+				groupByVar[newVar] = (varType, [mentor], team)
+	# create variables of type 2 (one per team)
+	for team in teams:
+		newVar = m.addVar(vtype = gp.GRB.BINARY)
+		m.update() # needed to ensure that the variable we just created can be used as a key in the groupByVar dictionary
+		variables.append(newVar)
+		varByType[2].append(newVar)
+		varByTeam[(2, team)].append(newVar)
+		groupByVar[newVar] = (2, [], team)
+	#create variables of type 4 (one per mentor-mentor-team group)
+	for (i1, i2, j) in scores.groupScores:
+		mentor1, mentor2, team = mentors[i1], mentors[i2], teams[j]
+		newVar = m.addVar(vtype = gp.GRB.BINARY)
+		m.update() # needed to ensure that the variable we just created can be used as a key in the groupByVar dictionary
+		variables.append(newVar)
+		varByType[4].append(newVar)
+		varByMentor[(4, mentor1)].append(newVar)
+		varByMentor[(4, mentor2)].append(newVar)
+		varByTeam[(4, team)].append(newVar)
+		varByPair[(4, mentor1, team)].append(newVar)
+		varByPair[(4, mentor2, team)].append(newVar)
+		groupByVar[newVar] = (4, [mentor1, mentor2], team)
+
+	print("Creating constraints...", flush = True)
+	constraints = []
+	# create type 1 constraints
+	for mentor in mentors:
+		typeOneVars = varByMentor[(1, mentor)]
+		constraints.append(sum(typeOneVars) == 1)
+	# create type 2 constraints
 	for team in teams:
-		typeOneVar = varByPair[(1, mentor, team)][0] # will only have a single variable in the list, so extract it
-		typeThreeVar = varByPair[(3, mentor, team)][0] # ditto
-		constraints.append(typeThreeVar <= typeOneVar)
-# create type 7 constraints
-M = len(mentors)
-for mentor in mentors:
+		typeOneVars = varByTeam[(1, team)]
+		constraints.append(sum(typeOneVars) >= utils.minNumMentors)
+		constraints.append(sum(typeOneVars) <= utils.maxNumMentors)
+	# create type 3 and 4 constraints
+	M = len(mentors)
 	for team in teams:
-		typeOneVar = varByPair[(1, mentor, team)][0] # will only have a single variable in the list, so extract it
-		typeFourVars = varByPair[(4, mentor, team)]
-		constraints.append(sum(typeFourVars) <= M * typeOneVar)
-
-print("Creating objective function...", flush = True)
-objectiveTerms = [] # list of terms that will be added together to make the objective function
-# create type 1 terms
-for var1 in varByType[1]:
-	_, varMentors, varTeam = groupByVar[var1] # figure out which mentor and team this variable is for
-	varMentor = varMentors[0] # list will only have one mentor in it
-	value = utils.getTeamCompatibility(varMentor, varTeam)
-	objectiveTerms.append(value * var1)
-# create type 2 terms
-for var3 in varByType[3]:
-	_, varMentors, varTeam = groupByVar[var3] # figure out which mentor and team this variable is for
-	varMentor = varMentors[0] # list will only have one mentor in it
-	value = utils.getAloneCompatibility(varMentor, varTeam)
-	objectiveTerms.append(value * var3)
-# create type 3 terms
-for var4 in varByType[4]:
-	_, varMentors, varTeam = groupByVar[var4] # figure out which mentor and team this variable is for
-	value = utils.getGroupCompatibility(varMentors[0], varMentors[1], varTeam)
-	objectiveTerms.append(value * var4)
-# create type 4 term
-numMentorReqs = 0 # how many pairs of mentors are required to be paired
-for mentor1 in mentors:
-	for mentor2 in mentors:
-		if mentor1.name >= mentor2.name:
-			continue # only consider each pair once, don't consider a mentor with themselves
-		if mentor1.mustPair(mentor2) or mentor2.mustPair(mentor1):
-			numMentorReqs += 1
-numTeamReqs = 0 # how many mentors must be paired with a team
-for mentor in mentors:
+		typeTwoVar = varByTeam[(2, team)][0] # will only have a single variable in the list, so extract it
+		typeOneVars = varByTeam[(1, team)]
+		constraints.append(M * typeTwoVar <= M + 1 - sum(typeOneVars)) # type 3
+		constraints.append(typeTwoVar >= 2 - sum(typeOneVars)) # type 4
+	# create type 5 constraints
 	for team in teams:
-		if team.mustAssign(mentor):
-			numTeamReqs += 1
-			break # make sure we don't count this mentor twice if they have multiple required teams
-offset = (numMentorReqs * utils.mentorRequiredValue) + (numTeamReqs * utils.teamRequiredValue)
-objective = sum(objectiveTerms) - offset
-
-print("Creating problem...", flush = True)
-for constraint in constraints:
-	m.addConstr(constraint)
-m.setObjective(objective, gp.GRB.MAXIMIZE)
-
-print("Solving problem...", flush = True)
-startTime = time.time()
-m.optimize()
-endTime = time.time()
-
-
-if m.Status not in [gp.GRB.Status.OPTIMAL, gp.GRB.Status.INTERRUPTED]:
-	# something went wrong with the solver
-	print("Something went wrong in the problem solving???")
-	possStatuses = ["N/A", "Not Yet Solved", "Optimum Found", "Infeasible", "Infeasible or Unbounded", "Unbounded", "Optimum Worse Than Cutoff",
-						"Iteration Limit Reached", "Node Limit Reached", "Time Limit Reached", "Solution Limit Reached", "Interrupted",
-						"Numerical Instability", "Suboptimal Solution", "Something About Asynchronus Stuff", "Objective Limit Reached"]
-	print("Problem status:", possStatuses[m.Status])
-	print("Time elapsed:", endTime - startTime)
-else:
-	# the solver succeeded, or was terminated early (but still gives us a not-quite-optimal solution)
-	print("Problem solved!  Time elapsed: " + str(endTime - startTime) + "\nFinal objective value of " + str(m.objVal))
+		typeTwoVar = varByTeam[(2, team)][0] # will only have a single variable in the list, so extract it
+		typeThreeVars = varByTeam[(3, team)]
+		constraints.append(sum(typeThreeVars) == typeTwoVar)
+	# create type 6 constraints
+	for mentor in mentors:
+		for team in teams:
+			typeOneVar = varByPair[(1, mentor, team)][0] # will only have a single variable in the list, so extract it
+			typeThreeVar = varByPair[(3, mentor, team)][0] # ditto
+			constraints.append(typeThreeVar <= typeOneVar)
+	# create type 7 constraints
+	M = len(mentors)
+	for mentor in mentors:
+		for team in teams:
+			typeOneVar = varByPair[(1, mentor, team)][0] # will only have a single variable in the list, so extract it
+			typeFourVars = varByPair[(4, mentor, team)]
+			constraints.append(sum(typeFourVars) <= M * typeOneVar)
+
+	print("Creating objective function...", flush = True)
+	objectiveTerms = [] # list of terms that will be added together to make the objective function
+	mentorIndex = {mentor: i for i, mentor in enumerate(mentors)}
+	teamIndex = {team: j for j, team in enumerate(teams)}
+	# create type 1 terms
+	for var1 in varByType[1]:
+		_, varMentors, varTeam = groupByVar[var1] # figure out which mentor and team this variable is for
+		varMentor = varMentors[0] # list will only have one mentor in it
+		value = scores.teamScores[mentorIndex[varMentor]][teamIndex[varTeam]]
+		objectiveTerms.append(value * var1)
+	# create type 2 terms
+	for var3 in varByType[3]:
+		_, varMentors, varTeam = groupByVar[var3] # figure out which mentor and team this variable is for
+		varMentor = varMentors[0] # list will only have one mentor in it
+		value = scores.aloneScores[mentorIndex[varMentor]][teamIndex[varTeam]]
+		objectiveTerms.append(value * var3)
+	# create type 3 terms
+	for var4 in varByType[4]:
+		_, varMentors, varTeam = groupByVar[var4] # figure out which mentor and team this variable is for
+		value = scores.groupScores[(mentorIndex[varMentors[0]], mentorIndex[varMentors[1]], teamIndex[varTeam])]
+		objectiveTerms.append(value * var4)
+	# type 4 term is the constant offset
+	objective = sum(objectiveTerms) - scores.offset
+
+	print("Creating problem...", flush = True)
+	for constraint in constraints:
+		m.addConstr(constraint)
+	m.setObjective(objective, gp.GRB.MAXIMIZE)
+
+	return problem
+
+def solveModel(problem, timeLimit = None, portfolioWorkers = None, portfolioLog = "portfolio-log.csv"):
+	"""
+	Runs the solver on a built Problem and stores the values of the variables in problem.solution
+	timeLimit is in seconds (None for no limit)
+	If portfolioWorkers is given, races that many differently-configured solves against each other (see portfolio.py), logging
+		each one's result to portfolioLog (None to skip logging)
+	Returns True if the solver succeeded, or was terminated early (but still gives us a not-quite-optimal solution), and False otherwise
+	"""
+	import gurobipy as gp
+
+	m = problem.model
+	startTime = time.time()
+	if portfolioWorkers is not None:
+		import portfolio
+		status, problem.solution = portfolio.solvePortfolio(problem, numWorkers = portfolioWorkers, timeLimit = timeLimit, logPath = portfolioLog)
+	else:
+		print("Solving problem...", flush = True)
+		if timeLimit is not None:
+			m.Params.TimeLimit = timeLimit
+		m.optimize()
+		status = m.Status
+		if m.SolCount > 0:
+			problem.solution = m.getAttr("X", m.getVars())
+	endTime = time.time()
+
+	if status not in [gp.GRB.Status.OPTIMAL, gp.GRB.Status.INTERRUPTED, gp.GRB.Status.TIME_LIMIT] or problem.solution is None:
+		# something went wrong with the solver
+		print("Something went wrong in the problem solving???")
+		print("Problem status:", solverStatusNames[status])
+		print("Time elapsed:", endTime - startTime)
+		return False
+	print("Problem solved!  Time elapsed: " + str(endTime - startTime) + "\nFinal objective value of " + str(getObjectiveValue(problem)))
+	return True
+
+def getObjectiveValue(problem):
+	"""
+	Returns the objective value of the solution stored in problem.solution
+	"""
+	objective = problem.model.getObjective()
+	value = objective.getConstant()
+	for termIndex in range(objective.size()):
+		value += objective.getCoeff(termIndex) * problem.solution[objective.getVar(termIndex).index]
+	return value
+
+def decodeMatching(problem):
+	"""
+	Reads the solution of a solved Problem
+	Returns a map from each mentor to the team they are assigned to
+	"""
 	teamByMentor = {} # mapping from a mentor to the team they are assigned to
+	for variable in problem.varByType[1]:
+		if problem.solution[variable.index] > 0.5:
+			_, varMentors, varTeam = problem.groupByVar[variable]
+			varMentor = varMentors[0] # there will only be one mentor in this list, so extract it
+			teamByMentor[varMentor] = varTeam
+	return teamByMentor
+
+
+"""
+Writing the matching
+"""
+
+def writeMatching(matchPath, mentors, teams, teamByMentor):
+	"""
+	Writes the matching given by teamByMentor (a map from mentor to team) to matchPath
+	"""
 	mentorsByTeam = {} # mapping from a team to a list of mentors assigned to that team
 	for team in teams:
 		mentorsByTeam[team] = [] # initialize all of these to empty lists so we can use append freely
-	for variable in varByType[1]:
-		if variable.x > 0.5:
-			_, varMentors, varTeam = groupByVar[variable]
-			varMentor = varMentors[0] # there will only be one mentor in this list, so extract it
-			teamByMentor[varMentor] = varTeam
-			mentorsByTeam[varTeam].append(varMentor)
-	with open('matching.csv', 'w', newline = '') as matchFile:
+	for mentor in mentors:
+		mentorsByTeam[teamByMentor[mentor]].append(mentor)
+	with open(matchPath, 'w', newline = '') as matchFile:
 		matchWriter = csv.writer(matchFile)
 		matchWriter.writerow(['Mentor Name', 'Team Name', 'Other Mentor(s)'])
 		for mentor in mentors:
@@ -222,4 +489,124 @@ else:
 				for omIndex in range(1, len(otherMentors)):
 					otherMentorsString += "; " + otherMentors[omIndex].name
 			matchWriter.writerow([mentor.name, team.name, otherMentorsString])
-	print("Matching output to matching.csv")
+	print("Matching output to " + matchPath)
+
+
+def readMatching(matchPath, mentors, teams):
+	"""
+	Reads a matching in the format written by writeMatching
+	Returns a map from mentor to team; will raise an exception if a mentor or team in the file is unknown or a mentor is missing
+	"""
+	teamByMentor = {}
+	with open(matchPath) as matchFile:
+		matchReader = csv.reader(matchFile)
+		next(matchReader, None) # throw out the header row
+		for dataRow in matchReader:
+			mentorMatches = [mentor for mentor in mentors if mentor.isMatch(dataRow[0])]
+			teamMatches = [team for team in teams if team.isMatch(dataRow[1])]
+			if not mentorMatches:
+				raise ValueError("Got unknown mentor " + dataRow[0] + " in " + matchPath)
+			if not teamMatches:
+				raise ValueError("Got unknown team " + dataRow[1] + " in " + matchPath)
+			teamByMentor[mentorMatches[0]] = teamMatches[0]
+	for mentor in mentors:
+		if mentor not in teamByMentor:
+			raise ValueError(mentor.name + " is not assigned to a team in " + matchPath)
+	return teamByMentor
+
+
+"""
+Running the whole pipeline
+"""
+
+def run(mentorPath = "mentors.csv", teamPath = "teams.csv", compatPath = "compatibility.csv", matchPath = "matching.csv", timeLimit = None, portfolioWorkers = None, candidateCount = None, cacheDir = None,
+		portfolioLog = "portfolio-log.csv"):
+	"""
+	Runs every stage of the pipeline, reading the input files and writing the compatibility matrix and matching
+	timeLimit, portfolioWorkers, and portfolioLog are passed on to solveModel
+	If candidateCount is given, only the top candidateCount co-mentors of each mentor for each team are modeled (see candidates.py)
+	If cacheDir is given, built models are saved there and reused by later runs with the same inputs and settings (see modelcache.py)
+	Returns the matching as a map from mentor to team, or None if the solver failed
+	"""
+	mentors, teams = loadData(mentorPath, teamPath)
+	for problemDescription in validateData(mentors, teams):
+		print("Warning: " + problemDescription)
+	problem = None
+	if cacheDir is not None:
+		import modelcache
+		fingerprint = getInputFingerprint(mentorPath, teamPath, candidateCount)
+		problem = modelcache.loadProblem(cacheDir, fingerprint, mentors, teams)
+	if problem is not None:
+		# the model already has the group scores baked in, so only the (cheap) mentor-team scores are needed
+		writeCompatibility(compatPath, mentors, teams, computeScores(mentors, teams, includeGroups = False))
+	else:
+		candidateGroups = None
+		if candidateCount is not None:
+			import candidates
+			print("Finding candidate co-mentors...", flush = True)
+			candidateGroups = candidates.getCandidateGroups(mentors, teams, candidateCount)
+		scores = computeScores(mentors, teams, candidateGroups = candidateGroups)
+		writeCompatibility(compatPath, mentors, teams, scores)
+		problem = buildModel(mentors, teams, scores)
+		if cacheDir is not None:
+			modelcache.saveProblem(cacheDir, fingerprint, problem)
+	if not solveModel(problem, timeLimit, portfolioWorkers, portfolioLog):
+		return None
+	teamByMentor = decodeMatching(problem)
+	writeMatching(matchPath, mentors, teams, teamByMentor)
+	return teamByMentor
+
+def parseArguments(argv):
+	"""
+	Parses command line arguments (not including the program name)
+	"""
+	parser = argparse.ArgumentParser(description = "Match mentors with teams.")
+	parser.add_argument("--mentors", default = "mentors.csv", help = "mentor data file (default: mentors.csv)")
+	parser.add_argument("--teams", default = "teams.csv", help = "team data file (default: teams.csv)")
+	parser.add_argument("--compatibility", default = "compatibility.csv", help = "where to write the compatibility matrix (default: compatibility.csv)")
+	parser.add_argument("--matching", default = "matching.csv", help = "where to write the matching (default: matching.csv)")
+	parser.add_argument("--time-limit", type = float, help = "stop the solver after this many seconds and use the best matching found so far")
+	parser.add_argument("--portfolio", type = int, nargs = "?", const = 0, metavar = "WORKERS",
+						help = "race WORKERS differently-configured solves in parallel (default: one per core)")
+	parser.add_argument("--portfolio-log", default = "portfolio-log.csv", help = "where to append portfolio results (default: portfolio-log.csv)")
+	parser.add_argument("--candidates", type = int, metavar = "K",
+						help = "only model the K most promising co-mentors of each mentor for each team (default: model all of them)")
+	parser.add_argument("--model-cache", metavar = "DIR", help = "save built models in DIR and reuse them when the inputs and settings haven't changed")
+	mode = parser.add_mutually_exclusive_group()
+	mode.add_argument("--validate-only", action = "store_true", help = "only read and check the input files")
+	mode.add_argument("--score-only", action = "store_true", help = "only read the input files and write the compatibility matrix")
+	return parser.parse_args(argv)
+
+def main(argv = None):
+	"""
+	Command line entry point; returns the process exit code
+	"""
+	args = parseArguments(sys.argv[1:] if argv is None else argv)
+	print("Process started!", flush = True)
+
+	if args.validate_only:
+		mentors, teams = loadData(args.mentors, args.teams)
+		problems = validateData(mentors, teams)
+		for problemDescription in problems:
+			print("Warning: " + problemDescription)
+		print("Read " + str(len(mentors)) + " mentors and " + str(len(teams)) + " teams; found " + str(len(problems)) + " problem(s)")
+		return 1 if problems else 0
+
+	if args.score_only:
+		mentors, teams = loadData(args.mentors, args.teams)
+		for problemDescription in validateData(mentors, teams):
+			print("Warning: " + problemDescription)
+		scores = computeScores(mentors, teams, includeGroups = False)
+		writeCompatibility(args.compatibility, mentors, teams, scores)
+		return 0
+
+	portfolioWorkers = args.portfolio
+	if portfolioWorkers == 0:
+		import portfolio
+		portfolioWorkers = portfolio.getDefaultWorkerCount()
+	teamByMentor = run(args.mentors, args.teams, args.compatibility, args.matching, args.time_limit, portfolioWorkers, args.candidates, args.model_cache, args.portfolio_log)
+	return 0 if teamByMentor is not None else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+Batch runner for matching many independent cohorts (eg several regions or seasons)
+
+Takes a manifest listing cohort directories, each containing its own mentors.csv and teams.csv, and runs the whole pipeline
+from assign.py on each of them, several at a time.  The output of every stage (parsed data, scores, matching) is saved in a
+checkpoints directory inside the cohort directory, tagged with a fingerprint of the inputs and settings, so rerunning an
+interrupted batch picks up each cohort where it stopped.  Each cohort gets a report.csv, and the batch as a whole gets a
+summary with one row per cohort.
+
+Manifest format: one cohort directory per line, relative to the manifest's directory; blank lines and lines starting with # are ignored.
+"""
+
+import assign
+import argparse
+import csv
+import multiprocessing
+import os
+import pickle
+import sys
+import time
+
+
+checkpointDirName = "checkpoints" # name of the directory inside each cohort directory where stage outputs are saved
+reportFields = ["Cohort", "Status", "Solver Status", "Mentors", "Teams", "Objective", "Resumed Stages", "Load Time", "Score Time", "Solve Time", "Total Time"]
+
+
+def readManifest(manifestPath):
+	"""
+	Returns the list of cohort directories listed in the manifest at manifestPath
+	"""
+	baseDir = os.path.dirname(os.path.abspath(manifestPath))
+	cohorts = []
+	with open(manifestPath) as manifestFile:
+		for line in manifestFile:
+			line = line.strip()
+			if line == "" or line.startswith("#"):
+				continue
+			cohorts.append(os.path.normpath(os.path.join(baseDir, line)))
+	return cohorts
+
+def loadCheckpoint(cohortDir, stage, fingerprint):
+	"""
+	Returns the saved output of the given stage for a cohort, or None if there isn't one saved for this fingerprint
+	"""
+	path = os.path.join(cohortDir, checkpointDirName, stage + ".pickle")
+	if not os.path.exists(path):
+		return None
+	try:
+		with open(path, 'rb') as checkpointFile:
+			savedFingerprint, value = pickle.load(checkpointFile)
+	except (OSError, EOFError, pickle.UnpicklingError):
+		return None # partially written or corrupted; just redo the stage
+	if savedFingerprint != fingerprint:
+		return None # inputs or settings changed since this was saved
+	return value
+
+def saveCheckpoint(cohortDir, stage, fingerprint, value):
+	"""
+	Saves the output of the given stage for a cohort
+	Writes to a temporary file first so an interruption can't leave a half-written checkpoint behind
+	"""
+	checkpointDir = os.path.join(cohortDir, checkpointDirName)
+	os.makedirs(checkpointDir, exist_ok = True)
+	path = os.path.join(checkpointDir, stage + ".pickle")
+	with open(path + ".tmp", 'wb') as checkpointFile:
+		pickle.dump((fingerprint, value), checkpointFile)
+	os.replace(path + ".tmp", path)
+
+def writeReport(reportPath, report):
+	"""
+	Writes a single cohort's report (a dictionary keyed by reportFields) to reportPath, one field per row
+	"""
+	with open(reportPath, 'w', newline = '') as reportFile:
+		reportWriter = csv.writer(reportFile)
+		reportWriter.writerow(["Field", "Value"])
+		for field in reportFields:
+			reportWriter.writerow([field, report.get(field, "")])
+
+def runCohort(cohortDir, candidateCount = None, timeLimit = None, solverThreads = None):
+	"""
+	Runs the whole pipeline on one cohort, reusing any checkpoints saved by an earlier run with the same inputs and settings
+	Writes compatibility.csv, matching.csv, and report.csv to the cohort directory and returns the report
+	Errors are caught and recorded in the report rather than raised, so one bad cohort doesn't stop the batch
+	"""
+	report = {"Cohort": cohortDir, "Status": "Failed"}
+	resumed = []
+	startTime = time.time()
+	try:
+		mentorPath = os.path.join(cohortDir, "mentors.csv")
+		teamPath = os.path.join(cohortDir, "teams.csv")
+		fingerprint = assign.getInputFingerprint(mentorPath, teamPath, candidateCount)
+
+		stageStart = time.time()
+		data = loadCheckpoint(cohortDir, "data", fingerprint)
+		if data is None:
+			data = assign.loadData(mentorPath, teamPath)
+			saveCheckpoint(cohortDir, "data", fingerprint, data)
+		else:
+			resumed.append("data")
+		mentors, teams = data
+		report["Mentors"], report["Teams"] = len(mentors), len(teams)
+		for problemDescription in assign.validateData(mentors, teams):
+			print(cohortDir + ": Warning: " + problemDescription)
+		report["Load Time"] = time.time() - stageStart
+
+		stageStart = time.time()
+		scores = loadCheckpoint(cohortDir, "scores", fingerprint)
+		if scores is None:
+			candidateGroups = None
+			if candidateCount is not None:
+				import candidates
+				candidateGroups = candidates.getCandidateGroups(mentors, teams, candidateCount)
+			scores = assign.computeScores(mentors, teams, candidateGroups = candidateGroups)
+			saveCheckpoint(cohortDir, "scores", fingerprint, scores)
+		else:
+			resumed.append("scores")
+		assign.writeCompatibility(os.path.join(cohortDir, "compatibility.csv"), mentors, teams, scores)
+		report["Score Time"] = time.time() - stageStart
+
+		# the matching is saved as a team index per mentor, since Mentor / Team objects don't keep their identity through pickling
+		# along with the solver status; a matching that wasn't proven optimal (eg the time limit was hit) is solved again next time
+		stageStart = time.time()
+		matching = loadCheckpoint(cohortDir, "matching", fingerprint)
+		if isinstance(matching, dict) and matching["optimal"]:
+			resumed.append("matching")
+		else:
+			import gurobipy as gp
+
+			problem = assign.buildModel(mentors, teams, scores)
+			if solverThreads is not None:
+				problem.model.Params.Threads = solverThreads
+			solved = assign.solveModel(problem, timeLimit)
+			report["Solver Status"] = assign.solverStatusNames[problem.model.Status]
+			if not solved:
+				report["Status"] = "Solver failed"
+				return report
+			teamIndex = {team: j for j, team in enumerate(teams)}
+			teamByMentor = assign.decodeMatching(problem)
+			matching = {"teamIndices": [teamIndex[teamByMentor[mentor]] for mentor in mentors],
+						"solverStatus": report["Solver Status"], "optimal": problem.model.Status == gp.GRB.Status.OPTIMAL}
+			saveCheckpoint(cohortDir, "matching", fingerprint, matching)
+		report["Solver Status"] = matching["solverStatus"]
+		teamIndices = matching["teamIndices"]
+		teamByMentor = {mentor: teams[j] for mentor, j in zip(mentors, teamIndices)}
+		assign.writeMatching(os.path.join(cohortDir, "matching.csv"), mentors, teams, teamByMentor)
+		report["Solve Time"] = time.time() - stageStart
+
+		report["Objective"] = assign.evaluateMatching(mentors, teams, scores, teamByMentor)
+		report["Status"] = "Done" if matching["optimal"] else "Stopped early (not proven optimal)"
+	except Exception as error:
+		report["Status"] = "Failed: " + type(error).__name__ + ": " + str(error)
+	finally:
+		report["Resumed Stages"] = " ".join(resumed)
+		report["Total Time"] = time.time() - startTime
+		if os.path.isdir(cohortDir):
+			writeReport(os.path.join(cohortDir, "report.csv"), report)
+	return report
+
+def _runCohortJob(job):
+	"""
+	Unpacks a job tuple for runCohort, so it can be used with Pool.imap_unordered
+	"""
+	return runCohort(*job)
+
+def runBatch(cohortDirs, summaryPath = "batch-summary.csv", candidateCount = None, timeLimit = None, solverThreads = 1, numWorkers = None):
+	"""
+	Runs every cohort in cohortDirs, numWorkers at a time (by default, as many as fit on the machine with solverThreads solver threads each)
+	Writes a summary of every cohort's report to summaryPath and returns the list of reports
+	"""
+	if numWorkers is None:
+		numWorkers = max(1, (os.cpu_count() or 1) // max(solverThreads, 1))
+	numWorkers = min(numWorkers, max(len(cohortDirs), 1))
+	print("Running " + str(len(cohortDirs)) + " cohorts with " + str(numWorkers) + " workers...", flush = True)
+
+	jobs = [(cohortDir, candidateCount, timeLimit, solverThreads) for cohortDir in cohortDirs]
+	reports = []
+	context = multiprocessing.get_context("spawn") # gurobipy environments don't survive being forked
+	with context.Pool(numWorkers) as pool:
+		for report in pool.imap_unordered(_runCohortJob, jobs):
+			print("Finished " + report["Cohort"] + ": " + report["Status"], flush = True)
+			reports.append(report)
+
+	reports.sort(key = lambda report: cohortDirs.index(report["Cohort"])) # summary follows the manifest's order
+	with open(summaryPath, 'w', newline = '') as summaryFile:
+		summaryWriter = csv.DictWriter(summaryFile, fieldnames = reportFields)
+		summaryWriter.writeheader()
+		for report in reports:
+			summaryWriter.writerow(report)
+	print("Summary output to " + summaryPath)
+	return reports
+
+def main(argv = None):
+	"""
+	Command line entry point; returns the process exit code (nonzero if any cohort failed or was not solved to optimality)
+	"""
+	parser = argparse.ArgumentParser(description = "Match mentors with teams for many cohorts.")
+	parser.add_argument("manifest", help = "file listing one cohort directory per line")
+	parser.add_argument("--summary", default = "batch-summary.csv", help = "where to write the summary of all cohorts (default: batch-summary.csv)")
+	parser.add_argument("--candidates", type = int, metavar = "K", help = "only model the K most promising co-mentors (see candidates.py)")
+	parser.add_argument("--time-limit", type = float, help = "time limit in seconds for each cohort's solve")
+	parser.add_argument("--solver-threads", type = int, default = 1, help = "threads the solver may use per cohort (default: 1)")
+	parser.add_argument("--workers", type = int, help = "cohorts to run at once (default: cores / solver threads)")
+	args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+	cohortDirs = readManifest(args.manifest)
+	reports = runBatch(cohortDirs, args.summary, args.candidates, args.time_limit, args.solver_threads, args.workers)
+	return 0 if all(report["Status"] == "Done" for report in reports) else 1
+
+
+if __name__ == "__main__":
+	sys.exit(main())
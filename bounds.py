@@ -0,0 +1,146 @@
+"""
+Cheap upper bounds on the best possible matching
+
+When the solver is stopped early (or a matching comes from somewhere else), this tells us how far from optimal the matching
+can be without solving the full problem.  The bound comes from a Lagrangian relaxation of the problem in assign.py:
+	* The group-linking constraints (type 7) are relaxed by splitting the value of each pair of co-mentors evenly between the two
+		mentors; a mentor on a team with other mentors can then get at most half the sum of their utils.maxNumMentors - 1 best
+		positive group scores on that team, and a mentor alone on a team gets their alone score.  Exact group scores are slow to
+		compute for every group, so the cheap upper bounds from candidates.py (plus any co-mentor request value) are used instead,
+		which keeps the bound valid.
+	* The team size constraints (type 2) are moved into the objective with one multiplier per team for each side of the constraint.
+With both relaxed, every mentor picks their best team independently, which is a single vectorized argmax over the score arrays.
+The multipliers are then improved with subgradient steps; every set of multipliers gives a valid upper bound, and we keep the best.
+"""
+
+import assign
+import utils
+import argparse
+import sys
+import time
+
+
+def getMentorTeamValues(mentors, teams, scores):
+	"""
+	Returns an array whose [i, j] entry is the most mentors[i] can contribute to the objective by being assigned to teams[j]
+	(once the group-linking constraints have been relaxed as described at the top of this file)
+	Only the mentor-team scores in scores are used; group scores are replaced by the cheap upper bounds from candidates.py
+	"""
+	import numpy as np
+	import candidates
+
+	numMentors, numTeams = len(mentors), len(teams)
+	teamScores = np.array(scores.teamScores, dtype = float).reshape(numMentors, numTeams)
+	aloneScores = np.array(scores.aloneScores, dtype = float).reshape(numMentors, numTeams)
+	numCoMentors = min(utils.maxNumMentors - 1, numMentors - 1)
+	if numCoMentors <= 0:
+		return teamScores + aloneScores # every mentor is alone
+
+	# co-mentor requests aren't part of the cheap bounds, so add them back on for the pairs that have them
+	requestsByMentor = [[] for _ in mentors]
+	for (i1, i2), requestValue in candidates.getRequestValues(mentors).items():
+		requestsByMentor[i1].append((i2, requestValue))
+		requestsByMentor[i2].append((i1, requestValue))
+
+	# half of the sum of each mentor's numCoMentors best positive group bounds on each team
+	groupBounds = candidates.GroupBounds(mentors, teams)
+	pairShares = np.zeros((numMentors, numTeams))
+	for i in range(numMentors):
+		upperBounds = groupBounds.getMentorBounds(i)
+		for i2, requestValue in requestsByMentor[i]:
+			upperBounds[i2, :] += requestValue
+		upperBounds = np.maximum(upperBounds, 0) # type 4 variables are only worth setting for positive scores
+		if numCoMentors == 1:
+			pairShares[i] = upperBounds.max(axis = 0) / 2
+		else:
+			pairShares[i] = np.partition(upperBounds, numMentors - numCoMentors, axis = 0)[numMentors - numCoMentors:].sum(axis = 0) / 2
+	return teamScores + np.maximum(aloneScores, pairShares)
+
+def computeUpperBound(mentors, teams, scores, lowerBound = None, iterations = 300):
+	"""
+	Returns an upper bound on the objective value of any matching, found with at most the given number of subgradient iterations
+	Only the mentor-team scores and offset in scores are used, so scores can come from assign.computeScores(..., includeGroups = False)
+	lowerBound is the value of a known matching if there is one; it is used to pick step sizes, and the search stops early once
+		the bound is within rounding error of it
+	"""
+	import numpy as np
+
+	numMentors, numTeams = len(mentors), len(teams)
+	values = getMentorTeamValues(mentors, teams, scores)
+	overMultipliers = np.zeros(numTeams) # for sum of a team's type 1 variables <= maxNumMentors
+	underMultipliers = np.zeros(numTeams) # for sum of a team's type 1 variables >= minNumMentors
+
+	bestBound = float("inf")
+	stepScale = 1.0 # Polyak step factor, halved whenever the bound stops improving
+	stepSize = max(float(np.abs(values).max()), 1.0) / 10 # fallback step size if we don't know a lower bound
+	sinceImprovement = 0
+	for iteration in range(iterations):
+		adjustedValues = values - overMultipliers + underMultipliers
+		choices = adjustedValues.argmax(axis = 1)
+		bound = (adjustedValues[np.arange(numMentors), choices].sum() + overMultipliers.sum() * utils.maxNumMentors
+				- underMultipliers.sum() * utils.minNumMentors - scores.offset)
+		if bound < bestBound - 1e-9:
+			bestBound = bound
+			sinceImprovement = 0
+		else:
+			sinceImprovement += 1
+			if sinceImprovement >= 20:
+				stepScale /= 2
+				stepSize /= 2
+				sinceImprovement = 0
+		if lowerBound is not None and bestBound - lowerBound <= 1e-6 * max(abs(lowerBound), 1):
+			break # proven optimal
+
+		# subgradient of the bound with respect to each multiplier
+		counts = np.bincount(choices, minlength = numTeams)
+		overGradient = utils.maxNumMentors - counts
+		underGradient = counts - utils.minNumMentors
+		normSquared = float((overGradient ** 2).sum() + (underGradient ** 2).sum())
+		if normSquared == 0:
+			break # the relaxed solution satisfies the team size constraints with no slack to exploit, so the bound can't improve
+		if lowerBound is not None:
+			step = stepScale * max(bound - lowerBound, 1e-6) / normSquared
+		else:
+			step = stepSize / np.sqrt(normSquared)
+		overMultipliers = np.maximum(overMultipliers - step * overGradient, 0)
+		underMultipliers = np.maximum(underMultipliers - step * underGradient, 0)
+	return float(bestBound)
+
+def reportGap(mentors, teams, scores, teamByMentor = None):
+	"""
+	Computes an upper bound for the problem and prints it, along with how far the matching teamByMentor (if given) can be from optimal
+	scores only needs mentor-team scores (see computeUpperBound)
+	Returns (bound, value of the matching or None)
+	"""
+	startTime = time.time()
+	value = None
+	if teamByMentor is not None:
+		value = assign.evaluateMatching(mentors, teams, scores, teamByMentor)
+	bound = computeUpperBound(mentors, teams, scores, lowerBound = value)
+	print("Upper bound on the objective value: " + str(bound) + " (computed in " + str(time.time() - startTime) + " seconds)")
+	if value is not None:
+		gap = bound - value
+		print("Matching has objective value " + str(value) + ", which is at most " + str(gap) + " (" + str(100 * gap / max(abs(bound), 1)) + "%) below optimal")
+	return bound, value
+
+def main(argv = None):
+	"""
+	Command line entry point; returns the process exit code
+	"""
+	parser = argparse.ArgumentParser(description = "Bound how far a matching can be from optimal.")
+	parser.add_argument("--mentors", default = "mentors.csv", help = "mentor data file (default: mentors.csv)")
+	parser.add_argument("--teams", default = "teams.csv", help = "team data file (default: teams.csv)")
+	parser.add_argument("--matching", help = "matching to compare against the bound, in the format assign.py writes")
+	args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+	mentors, teams = assign.loadData(args.mentors, args.teams)
+	scores = assign.computeScores(mentors, teams, includeGroups = False)
+	teamByMentor = None
+	if args.matching is not None:
+		teamByMentor = assign.readMatching(args.matching, mentors, teams)
+	reportGap(mentors, teams, scores, teamByMentor)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
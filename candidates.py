@@ -0,0 +1,201 @@
+"""
+Candidate co-mentors for the group (type 4) layer of the optimization problem
+
+Most mentor pairs add little value to a given team, but the full problem has a type 4 variable (and a call to
+getGroupCompatibility) for every mentor-mentor-team group.  This file finds, for every mentor-team pair, the k other
+mentors that could add the most value to that team alongside them, judged by a cheap upper bound on getGroupCompatibility.
+Only those groups (plus every pair of mentors that requested or are required to be together) are then scored and modeled.
+
+The upper bound on a group's score is
+	* the smallest of the three pairwise availability overlaps between the two mentors and the team (the three-way overlap
+		can't be larger than any of them), valued like getPairOverlapValue
+	* plus the skills value of the pair, which is just the per-skill maximum of the two mentors' values (exact)
+Requests are left out since requested / required pairs are always kept.
+
+Running this file measures recall: how many of the groups used by the optimal matching of the full problem are kept for each k.
+"""
+
+import assign
+import utils
+import argparse
+import os
+import sys
+
+
+def getAvailabilityMatrix(people):
+	"""
+	Returns a 0/1 array with a row for each mentor / team and a column for each slot of the week
+	"""
+	import numpy as np
+
+	return np.array([[slot for day in person.availability for slot in day] for person in people], dtype = float).reshape(len(people), -1)
+
+def getSkillValueMatrices(mentors, teams):
+	"""
+	Returns a list with one array per skill, whose [i, j] entry is the skill value mentors[i] gives teams[j] for that skill
+	"""
+	import numpy as np
+
+	skillValues = []
+	for skill in range(utils.numSkills):
+		mentorLevels = [utils.skillConfidenceLevels.index(mentor.skillsConfidence[skill]) for mentor in mentors]
+		teamLevels = [utils.skillRequestLevels.index(team.skillRequests[skill]) for team in teams]
+		skillValues.append(np.array([[utils.skillMatchValues[teamLevel][mentorLevel] for teamLevel in teamLevels] for mentorLevel in mentorLevels],
+									dtype = float).reshape(len(mentors), len(teams)))
+	return skillValues
+
+def getRequestValues(mentors):
+	"""
+	Returns a map from (i1, i2) index pairs (ordered as in assign.getOrderedPairs) to utils.getMentorRequestedValue for every pair of
+	mentors who requested or are required to be together
+	Looks names up directly instead of comparing every pair of mentors, so it stays fast for large cohorts
+	"""
+	indicesByName = {} # map from a name, normalized like Mentor.isMatch does, to the indices of the mentors with that name
+	for i, mentor in enumerate(mentors):
+		indicesByName.setdefault(mentor.name.replace(" ", "").lower(), []).append(i)
+
+	def getPairs(i, names):
+		pairs = set()
+		for name in names:
+			for i2 in indicesByName.get(name.replace(" ", "").lower(), []):
+				if mentors[i].name < mentors[i2].name:
+					pairs.add((i, i2))
+				elif mentors[i2].name < mentors[i].name:
+					pairs.add((i2, i))
+		return pairs
+
+	requiredPairs, requestedPairs = set(), set()
+	for i, mentor in enumerate(mentors):
+		requiredPairs |= getPairs(i, mentor.mentorsRequired)
+		requestedPairs |= getPairs(i, mentor.mentorsRequested)
+	requestValues = {pair: utils.mentorRequestedValue for pair in requestedPairs}
+	requestValues.update({pair: utils.mentorRequiredValue for pair in requiredPairs}) # requirements take priority, as in getMentorRequestedValue
+	return requestValues
+
+def getRequestedPairs(mentors):
+	"""
+	Returns the set of (i1, i2) index pairs (ordered as in assign.getOrderedPairs) of mentors who requested or are required to be together
+	"""
+	return set(getRequestValues(mentors))
+
+"""
+class for computing cheap upper bounds on group scores (see the top of this file)
+the matrices it needs are computed once, so the bounds for each mentor take a handful of vectorized operations
+"""
+class GroupBounds:
+	def __init__(self, mentors, teams):
+		import numpy as np
+
+		mentorAvailability = getAvailabilityMatrix(mentors)
+		teamAvailability = getAvailabilityMatrix(teams)
+		self.pairOverlaps = mentorAvailability @ mentorAvailability.T # [i1, i2] is the number of slots both mentors are available
+		self.teamOverlaps = mentorAvailability @ teamAvailability.T # [i, j] is the number of slots both the mentor and team are available
+		self.skillValues = getSkillValueMatrices(mentors, teams)
+		self.names = np.array([mentor.name for mentor in mentors], dtype = object)
+
+	def getMentorBounds(self, i):
+		"""
+		Returns an array whose [i2, j] entry is an upper bound on the score of the group mentors[i], mentors[i2], teams[j], not counting
+		co-mentor requests; entries are -inf for mentors that never share a type 4 variable with mentors[i] (same name, including itself)
+		"""
+		import numpy as np
+
+		overlapBound = np.minimum(np.minimum(self.pairOverlaps[i][:, None], self.teamOverlaps[i][None, :]), self.teamOverlaps)
+		upperBounds = overlapBound * utils.minutesPerSlot * utils.pairOverlapValue
+		for skillValue in self.skillValues:
+			upperBounds += np.maximum(skillValue[i][None, :], skillValue)
+		upperBounds[self.names == self.names[i], :] = -np.inf
+		return upperBounds
+
+def getCandidateGroups(mentors, teams, k):
+	"""
+	Returns the set of (i1, i2, j) groups to model when keeping the top k co-mentors of each mentor for each team
+	Groups are ordered like the keys of assign.Scores.groupScores; requested and required pairs are kept for every team
+	"""
+	import numpy as np
+
+	numMentors, numTeams = len(mentors), len(teams)
+	groupBounds = GroupBounds(mentors, teams)
+
+	groups = set()
+	numPartners = min(k, numMentors - 1)
+	for i in range(numMentors):
+		if numPartners <= 0:
+			break
+		upperBounds = groupBounds.getMentorBounds(i)
+		partners = np.argpartition(-upperBounds, numPartners - 1, axis = 0)[:numPartners]
+		for j in range(numTeams):
+			for i2 in partners[:, j]:
+				if upperBounds[i2, j] == -np.inf:
+					continue
+				if mentors[i].name < mentors[i2].name:
+					groups.add((i, int(i2), j))
+				else:
+					groups.add((int(i2), i, j))
+
+	for i1, i2 in getRequestedPairs(mentors):
+		for j in range(numTeams):
+			groups.add((i1, i2, j))
+	return groups
+
+def getUsedGroups(mentors, teams, scores, teamByMentor):
+	"""
+	Returns the set of groups whose type 4 variable is worth setting in the matching teamByMentor
+	(both mentors on the same team, and a positive group score)
+	"""
+	teamIndex = {team: j for j, team in enumerate(teams)}
+	used = set()
+	for (i1, i2, j), groupScore in scores.groupScores.items():
+		if groupScore > 0 and teamIndex[teamByMentor[mentors[i1]]] == j and teamIndex[teamByMentor[mentors[i2]]] == j:
+			used.add((i1, i2, j))
+	return used
+
+def measureRecall(mentors, teams, kValues, timeLimit = None):
+	"""
+	Solves the full problem, then for each k in kValues solves the problem restricted to the top k candidates
+	Returns a list of (k, number of groups kept, recall, objective value of the restricted matching under the full scores),
+		where recall is the fraction of groups used by the full optimum that were kept (1 if the optimum uses none);
+		the first entry has k = None and describes the full problem
+	"""
+	fullScores = assign.computeScores(mentors, teams)
+	fullProblem = assign.buildModel(mentors, teams, fullScores)
+	if not assign.solveModel(fullProblem, timeLimit):
+		raise RuntimeError("Could not solve the full problem")
+	fullMatching = assign.decodeMatching(fullProblem)
+	usedGroups = getUsedGroups(mentors, teams, fullScores, fullMatching)
+	results = [(None, len(fullScores.groupScores), 1.0, assign.evaluateMatching(mentors, teams, fullScores, fullMatching))]
+
+	for k in kValues:
+		candidateGroups = getCandidateGroups(mentors, teams, k)
+		recall = len(usedGroups & candidateGroups) / len(usedGroups) if usedGroups else 1.0
+		scores = assign.computeScores(mentors, teams, candidateGroups = candidateGroups)
+		problem = assign.buildModel(mentors, teams, scores)
+		value = None
+		if assign.solveModel(problem, timeLimit):
+			value = assign.evaluateMatching(mentors, teams, fullScores, assign.decodeMatching(problem))
+		results.append((k, len(candidateGroups), recall, value))
+	return results
+
+def main(argv = None):
+	"""
+	Command line entry point; returns the process exit code
+	"""
+	parser = argparse.ArgumentParser(description = "Measure how well top-k co-mentor candidates preserve the optimal matching.")
+	parser.add_argument("cohorts", nargs = "*", default = ["."], help = "directories containing mentors.csv and teams.csv (default: .)")
+	parser.add_argument("--k", type = int, nargs = "+", default = [1, 2, 5, 10, 20], help = "values of k to try")
+	parser.add_argument("--time-limit", type = float, help = "time limit in seconds for each solve")
+	args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+	summaries = []
+	for cohort in args.cohorts:
+		mentors, teams = assign.loadData(os.path.join(cohort, "mentors.csv"), os.path.join(cohort, "teams.csv"))
+		summaries.append((cohort, measureRecall(mentors, teams, args.k, args.time_limit)))
+	for cohort, results in summaries:
+		print("Cohort " + cohort + ":")
+		for k, numGroups, recall, value in results:
+			print("\tk = " + ("all" if k is None else str(k)) + ": " + str(numGroups) + " groups, recall " + str(recall) + ", objective value " + str(value))
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+On-disk cache of built optimization problems
+
+Building the problem (especially the type 4 layer) is slow, and re-solving the same cohort with different solver settings
+or time limits doesn't change it.  This file saves a built Problem as an MPS file, which Gurobi can read back much faster
+than assign.buildModel can create it, along with a compact index file recording what each variable means (the information
+held in groupByVar / varByType).  Entries are named by a fingerprint of the inputs and settings (see
+assign.getInputFingerprint), so a changed input or weight never loads a stale model.
+
+Index file format (JSON): {"fingerprint": ..., "numMentors": ..., "numTeams": ...,
+	"variables": one [variable type, team index, mentor indices...] list per variable, in the order of model.getVars()}
+"""
+
+import assign
+import json
+import os
+
+
+def getCachePaths(cacheDir, fingerprint):
+	"""
+	Returns the (model path, index path) of the cache entry for fingerprint
+	"""
+	return os.path.join(cacheDir, fingerprint + ".mps"), os.path.join(cacheDir, fingerprint + ".index.json")
+
+def saveProblem(cacheDir, fingerprint, problem):
+	"""
+	Saves a built Problem to the cache under the given fingerprint
+	The index is written last, so an interrupted save never leaves an entry that looks complete
+	"""
+	os.makedirs(cacheDir, exist_ok = True)
+	modelPath, indexPath = getCachePaths(cacheDir, fingerprint)
+	mentorIndex = {mentor: i for i, mentor in enumerate(problem.mentors)}
+	teamIndex = {team: j for j, team in enumerate(problem.teams)}
+
+	variableInfo = [None] * len(problem.variables)
+	for variable in problem.variables:
+		varType, varMentors, varTeam = problem.groupByVar[variable]
+		variableInfo[variable.index] = [varType, teamIndex[varTeam]] + [mentorIndex[mentor] for mentor in varMentors]
+
+	print("Saving model to " + modelPath + "...", flush = True)
+	problem.model.write(modelPath)
+	index = {"fingerprint": fingerprint, "numMentors": len(problem.mentors), "numTeams": len(problem.teams), "variables": variableInfo}
+	with open(indexPath + ".tmp", 'w') as indexFile:
+		json.dump(index, indexFile, separators = (",", ":"))
+	os.replace(indexPath + ".tmp", indexPath)
+
+def loadProblem(cacheDir, fingerprint, mentors, teams):
+	"""
+	Loads the Problem saved under fingerprint, using the given (freshly loaded) mentors and teams for its bookkeeping
+	Returns None if there is no usable cache entry for fingerprint
+	"""
+	modelPath, indexPath = getCachePaths(cacheDir, fingerprint)
+	if not os.path.exists(indexPath) or not os.path.exists(modelPath):
+		return None
+	with open(indexPath) as indexFile:
+		index = json.load(indexFile)
+	if index["fingerprint"] != fingerprint or index["numMentors"] != len(mentors) or index["numTeams"] != len(teams):
+		print("Cached model " + modelPath + " does not match the inputs; ignoring it")
+		return None
+
+	import gurobipy as gp
+
+	print("Loading model from " + modelPath + "...", flush = True)
+	model = gp.read(modelPath)
+	modelVars = model.getVars()
+	if len(modelVars) != len(index["variables"]):
+		print("Cached model " + modelPath + " does not match its index; ignoring it")
+		return None
+
+	problem = assign.Problem(model, mentors, teams)
+	# initialize varByType, varByMentor, varByTeam, and varByPair with empty lists to prevent KeyErrors later
+	for varType in [1, 2, 3, 4]:
+		problem.varByType[varType] = []
+		for mentor in mentors:
+			problem.varByMentor[(varType, mentor)] = []
+			for team in teams:
+				problem.varByPair[(varType, mentor, team)] = []
+		for team in teams:
+			problem.varByTeam[(varType, team)] = []
+	for variable, info in zip(modelVars, index["variables"]):
+		varType, team, varMentors = info[0], teams[info[1]], [mentors[i] for i in info[2:]]
+		problem.variables.append(variable)
+		problem.varByType[varType].append(variable)
+		problem.varByTeam[(varType, team)].append(variable)
+		for mentor in varMentors:
+			problem.varByMentor[(varType, mentor)].append(variable)
+			problem.varByPair[(varType, mentor, team)].append(variable)
+		problem.groupByVar[variable] = (varType, varMentors, team)
+	return problem
@@ -0,0 +1,198 @@
+"""
+Parallel solver portfolio for the matching problem
+
+Solve time varies a lot with the solver's seed and parameters, so instead of a single solve with default settings we can
+race several differently-configured solves of the same model against each other, each in its own process.  Whenever one
+of them finds a better matching, it is shared with the others so they can prune with it.  As soon as one proves
+optimality (or the time limit is hit) the rest are stopped.  Every run is logged so the default settings can be tuned
+from historical results.
+"""
+
+import csv
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+
+
+# parameter sets the portfolio cycles through; worker i uses portfolioConfigs[i % len(portfolioConfigs)]
+# names are gurobipy parameter names
+portfolioConfigs = [{}, # Gurobi's defaults
+					{"MIPFocus": 1, "Heuristics": 0.2}, # look for good matchings quickly
+					{"MIPFocus": 2}, # focus on proving optimality
+					{"MIPFocus": 3, "Presolve": 2}, # focus on moving the bound
+					{"Presolve": 0, "Heuristics": 0.5},
+					{"MIPFocus": 1, "Presolve": 2, "Cuts": 0},
+					{"Heuristics": 0.05, "Cuts": 2},
+					{"MIPFocus": 2, "Presolve": 1, "Symmetry": 2}]
+
+portfolioLogFields = ["Time", "Worker", "Parameters", "Seed", "Status", "Objective", "Bound", "Runtime", "Winner"]
+
+
+def getDefaultWorkerCount():
+	"""
+	Returns the number of portfolio workers to use if none is given (one per core, but at most one per configuration)
+	"""
+	return max(1, min(os.cpu_count() or 1, len(portfolioConfigs)))
+
+def _runWorker(workerIndex, modelPath, params, seed, threads, timeLimit, shared, resultQueue):
+	"""
+	Body of a portfolio worker process
+	Reads the model from modelPath, solves it with the given parameters and seed, and puts a result tuple
+		(workerIndex, status, objective, bound, runtime, solution) on resultQueue
+	shared holds the best incumbent found by any worker and the event used to stop everyone
+	"""
+	import gurobipy as gp
+
+	bestObj, bestValues, bestVersion, lock, stopEvent = shared
+	model = gp.read(modelPath)
+	model.Params.OutputFlag = 0
+	model.Params.Threads = threads
+	model.Params.Seed = seed
+	if timeLimit is not None:
+		model.Params.TimeLimit = timeLimit
+	for name, value in params.items():
+		model.setParam(name, value)
+	modelVars = model.getVars()
+	lastSeenVersion = [0] # version of the shared incumbent this worker has already used
+
+	def callback(cbModel, where):
+		if stopEvent.is_set():
+			cbModel.terminate()
+			return
+		if where == gp.GRB.Callback.MIPSOL:
+			# found a new incumbent; publish it if it beats everyone else's
+			objective = cbModel.cbGet(gp.GRB.Callback.MIPSOL_OBJ)
+			with lock:
+				if objective > bestObj.value:
+					bestObj.value = objective
+					bestValues[:] = cbModel.cbGetSolution(modelVars)
+					bestVersion.value += 1
+					lastSeenVersion[0] = bestVersion.value
+		elif where == gp.GRB.Callback.MIPNODE:
+			# offer someone else's better incumbent to this solve
+			if bestVersion.value == lastSeenVersion[0]:
+				return
+			if cbModel.cbGet(gp.GRB.Callback.MIPNODE_STATUS) != gp.GRB.Status.OPTIMAL:
+				return
+			with lock:
+				lastSeenVersion[0] = bestVersion.value
+				if bestObj.value <= cbModel.cbGet(gp.GRB.Callback.MIPNODE_OBJBST):
+					return
+				values = bestValues[:]
+			cbModel.cbSetSolution(modelVars, values)
+
+	model.optimize(callback)
+	solution = model.getAttr("X", modelVars) if model.SolCount > 0 else None
+	objective = model.ObjVal if model.SolCount > 0 else None
+	bound = model.ObjBound if model.SolCount > 0 else None
+	resultQueue.put((workerIndex, model.Status, objective, bound, model.Runtime, solution))
+
+def _appendLog(logPath, rows):
+	"""
+	Appends the given rows (dictionaries keyed by portfolioLogFields) to the portfolio log at logPath, writing a header if the file is new
+	"""
+	isNew = not os.path.exists(logPath) or os.path.getsize(logPath) == 0
+	with open(logPath, 'a', newline = '') as logFile:
+		logWriter = csv.DictWriter(logFile, fieldnames = portfolioLogFields)
+		if isNew:
+			logWriter.writeheader()
+		for row in rows:
+			logWriter.writerow(row)
+
+def solvePortfolio(problem, numWorkers = None, timeLimit = None, baseSeed = 0, logPath = "portfolio-log.csv"):
+	"""
+	Solves a built Problem (see assign.buildModel) with a portfolio of numWorkers differently-configured solves running in parallel
+	timeLimit is the budget in seconds for the whole portfolio, counted from when this is called (None for no limit);
+		once it runs out every worker is told to stop and the best matching found so far is used
+	Returns (status, solution) for the winning worker, where solution is a list of variable values in the order of problem.model.getVars()
+		(None if no worker found a solution); the winner is the first worker to prove optimality, or else the one with the best objective
+	Every worker's result is appended to the log at logPath (skipped if logPath is None)
+	"""
+	import gurobipy as gp
+
+	deadline = None if timeLimit is None else time.time() + timeLimit
+	if numWorkers is None:
+		numWorkers = getDefaultWorkerCount()
+	threads = max(1, (os.cpu_count() or 1) // numWorkers) # split the cores evenly between workers
+
+	context = multiprocessing.get_context("spawn") # gurobipy environments don't survive being forked
+	numVars = problem.model.NumVars
+	lock = context.Lock()
+	shared = (context.Value('d', -gp.GRB.INFINITY, lock = False), context.Array('d', numVars, lock = False),
+				context.Value('i', 0, lock = False), lock, context.Event())
+	stopEvent = shared[4]
+	resultQueue = context.Queue()
+
+	results = {}
+	winner = None
+	workerSettings = []
+	with tempfile.TemporaryDirectory() as modelDir:
+		modelPath = os.path.join(modelDir, "model.mps")
+		problem.model.write(modelPath)
+
+		print("Solving problem with a portfolio of " + str(numWorkers) + " workers...", flush = True)
+		workers = []
+		try:
+			for workerIndex in range(numWorkers):
+				params = portfolioConfigs[workerIndex % len(portfolioConfigs)]
+				seed = baseSeed + workerIndex
+				workerSettings.append((params, seed))
+				# each worker's own time limit is only a backstop; the deadline below is what enforces the budget
+				worker = context.Process(target = _runWorker, args = (workerIndex, modelPath, params, seed, threads, timeLimit, shared, resultQueue))
+				worker.start()
+				workers.append(worker)
+
+			# collect results until someone proves optimality or everyone is done
+			while len(results) < len(workers):
+				if deadline is not None and time.time() >= deadline:
+					stopEvent.set() # out of time; workers report their best matching so far
+				try:
+					result = resultQueue.get(timeout = 1)
+				except queue.Empty:
+					if not any(worker.is_alive() for worker in workers) and resultQueue.empty():
+						break # a worker died without reporting anything
+					continue
+				results[result[0]] = result
+				if result[1] == gp.GRB.Status.OPTIMAL and winner is None:
+					winner = result[0]
+					stopEvent.set() # tell everyone else to stop
+		finally:
+			stopEvent.set()
+			# keep draining results while waiting, since a worker can't exit until its result has been read
+			while any(worker.is_alive() for worker in workers):
+				try:
+					result = resultQueue.get(timeout = 0.1)
+					results[result[0]] = result
+				except queue.Empty:
+					pass
+			for worker in workers:
+				worker.join()
+
+	if winner is None:
+		# nobody proved optimality, so take the best matching anyone found
+		solved = [result for result in results.values() if result[2] is not None]
+		if solved:
+			winner = max(solved, key = lambda result: result[2])[0]
+
+	if logPath is not None:
+		now = time.strftime("%Y-%m-%d %H:%M:%S")
+		rows = []
+		for workerIndex in sorted(results):
+			_, status, objective, bound, runtime, _ = results[workerIndex]
+			params, seed = workerSettings[workerIndex]
+			rows.append({"Time": now, "Worker": workerIndex, "Parameters": " ".join(name + "=" + str(value) for name, value in params.items()),
+						"Seed": seed, "Status": status, "Objective": objective, "Bound": bound, "Runtime": runtime,
+						"Winner": workerIndex == winner})
+		_appendLog(logPath, rows)
+
+	if winner is None:
+		# nobody found anything; report the status of any worker that finished
+		if results:
+			return results[min(results)][1], None
+		return gp.GRB.Status.INTERRUPTED, None
+	_, status, _, _, runtime, solution = results[winner]
+	params, seed = workerSettings[winner]
+	print("Worker " + str(winner) + " won (parameters " + str(params) + ", seed " + str(seed) + ") after " + str(runtime) + " seconds", flush = True)
+	return status, solution
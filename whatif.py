@@ -0,0 +1,302 @@
+"""
+What-if queries on an existing matching
+
+Answers questions like "how much worse is the matching if mentor X goes to team Y?" without re-running assign.py.
+Each query is first answered locally: the requested change is made, and if it breaks a team size limit, the best single
+extra move that fixes it is found (eg moving one of team Y's mentors into the team X left).  Only the teams that change are
+re-scored.  Mentor-team scores are computed up front, but group scores are only computed (and remembered) for the
+groups a query actually looks at, so a query takes well under a second even for large cohorts.
+If no local fix exists, the optimization problem is re-solved with the change forced, starting from the current matching;
+the model is only built the first time this happens, and is reused (with the extra constraints removed) afterwards.
+"""
+
+import assign
+import utils
+import argparse
+import sys
+
+
+"""
+class describing the answer to a what-if query
+attributes:
+	delta: change in objective value compared to the current matching (None if no matching with the change was found)
+	changes: list of (mentor, old team, new team) for every mentor that would move
+	method: "local" if answered by local repair, "re-solve" if the solver was needed, None if the change is impossible
+	solverStatus: name of the solver status if a re-solve stopped (eg at the time limit) without finding a matching, otherwise None
+"""
+class WhatIfResult:
+	def __init__(self, delta, changes, method, solverStatus = None):
+		self.delta = delta
+		self.changes = changes
+		self.method = method
+		self.solverStatus = solverStatus
+
+	def describe(self):
+		"""
+		Returns a human-readable description of this result
+		"""
+		if self.method is None:
+			return "Impossible: no matching satisfies this change"
+		if self.delta is None:
+			return "Unknown: the " + self.method + " stopped without finding a matching (" + self.solverStatus + "), so this change may still be possible"
+		lines = ["Objective change: " + str(self.delta) + " (found by " + self.method + ")"]
+		for mentor, oldTeam, newTeam in self.changes:
+			lines.append("\t" + mentor.name + ": " + oldTeam.name + " -> " + newTeam.name)
+		return "\n".join(lines)
+
+"""
+class for answering what-if queries about a matching
+attributes:
+	mentors, teams: the lists of mentors and teams the matching is for
+	scores: the Scores used to value matchings; groupScores may be None, in which case group scores are computed as needed
+	candidateGroups: if given, the set of (i1, i2, j) groups that are modeled (see candidates.py); other groups are worth nothing
+	problem: the built Problem used for re-solves (None until one is needed, unless one was passed in)
+	assignment: assignment[i] is the index of the team mentors[i] is currently assigned to
+	members: members[j] is the set of indices of mentors currently assigned to teams[j]
+"""
+class WhatIf:
+	def __init__(self, mentors, teams, scores, teamByMentor, problem = None, candidateGroups = None):
+		self.mentors = mentors
+		self.teams = teams
+		self.scores = scores
+		self.candidateGroups = candidateGroups
+		self.problem = problem
+		self.mentorIndex = {mentor: i for i, mentor in enumerate(mentors)}
+		self.teamIndex = {team: j for j, team in enumerate(teams)}
+		self.assignment = [self.teamIndex[teamByMentor[mentor]] for mentor in mentors]
+		self.members = [set() for _ in teams]
+		for i, j in enumerate(self.assignment):
+			self.members[j].add(i)
+		self.groupValues = {} # map from (i1, i2, j) (ordered as in assign.getOrderedPairs) to the group's value, filled in as needed
+
+	def getGroupValue(self, i1, i2, j):
+		"""
+		Returns how much the group mentors[i1], mentors[i2], teams[j] adds to the objective if both mentors are on the team
+		(its group score if positive and the group is modeled, otherwise zero)
+		"""
+		if self.mentors[i1].name == self.mentors[i2].name:
+			return 0 # mentors with the same name never share a type 4 variable
+		if self.mentors[i2].name < self.mentors[i1].name:
+			i1, i2 = i2, i1
+		group = (i1, i2, j)
+		if group not in self.groupValues:
+			if self.scores.groupScores is not None:
+				groupScore = self.scores.groupScores.get(group, 0)
+			elif self.candidateGroups is not None and group not in self.candidateGroups:
+				groupScore = 0
+			else:
+				groupScore = utils.getGroupCompatibility(self.mentors[i1], self.mentors[i2], self.teams[j])
+			self.groupValues[group] = max(groupScore, 0)
+		return self.groupValues[group]
+
+	def getTeamValue(self, j, teamMembers):
+		"""
+		Returns how much teams[j] contributes to the objective if teamMembers (a list of mentor indices) are assigned to it
+		"""
+		value = 0
+		for i in teamMembers:
+			value += self.scores.teamScores[i][j]
+		if len(teamMembers) == 1:
+			value += self.scores.aloneScores[teamMembers[0]][j]
+		for position, i1 in enumerate(teamMembers):
+			for i2 in teamMembers[position + 1:]:
+				value += self.getGroupValue(i1, i2, j)
+		return value
+
+	def evaluateMoves(self, moves):
+		"""
+		Returns the change in objective value from making moves (a map from mentor index to new team index),
+		or None if the result would break a team size limit
+		"""
+		affectedTeams = set(moves.values())
+		for i in moves:
+			affectedTeams.add(self.assignment[i])
+		delta = 0
+		for j in affectedTeams:
+			newMembers = [i for i in self.members[j] if moves.get(i, j) == j] + [i for i, newTeam in moves.items() if newTeam == j and self.assignment[i] != j]
+			if len(newMembers) < utils.minNumMentors or len(newMembers) > utils.maxNumMentors:
+				return None
+			delta += self.getTeamValue(j, newMembers) - self.getTeamValue(j, list(self.members[j]))
+		return delta
+
+	def repairMoves(self, moves):
+		"""
+		Finds the best way to make moves (a map from mentor index to new team index) feasible with at most one extra move
+		of a mentor not in moves
+		Returns (delta, moves including the repair), or None if there is no such way
+		"""
+		best = None
+		options = [moves]
+		affectedTeams = set(moves.values()) | set(self.assignment[i] for i in moves)
+		for j in affectedTeams:
+			# only moving someone out of a team that gains mentors, or into a team that loses them, can help
+			for i in self.members[j]:
+				if i not in moves:
+					options.extend({**moves, i: newTeam} for newTeam in range(len(self.teams)) if newTeam != j)
+			for i in range(len(self.mentors)):
+				if i not in moves and self.assignment[i] != j:
+					options.append({**moves, i: j})
+		for option in options:
+			delta = self.evaluateMoves(option)
+			if delta is not None and (best is None or delta > best[0]):
+				best = (delta, option)
+		return best
+
+	def describeMoves(self, moves):
+		"""
+		Returns the list of (mentor, old team, new team) for the mentors that actually change teams in moves
+		"""
+		return [(self.mentors[i], self.teams[self.assignment[i]], self.teams[j]) for i, j in sorted(moves.items()) if self.assignment[i] != j]
+
+	def resolve(self, fixedPairs, togetherPairs, timeLimit = None):
+		"""
+		Re-solves the optimization problem with mentors[i] forced onto teams[j] for every (i, j) in fixedPairs, and mentors[i1] and
+		mentors[i2] forced onto the same team for every (i1, i2) in togetherPairs, starting from the current matching
+		Returns a WhatIfResult
+		"""
+		import gurobipy as gp
+
+		if self.problem is None:
+			scores = self.scores
+			if scores.groupScores is None:
+				scores = assign.computeScores(self.mentors, self.teams, candidateGroups = self.candidateGroups)
+			self.problem = assign.buildModel(self.mentors, self.teams, scores)
+		problem = self.problem
+		m = problem.model
+
+		# start from the current matching
+		for i, mentor in enumerate(self.mentors):
+			for j, team in enumerate(self.teams):
+				problem.varByPair[(1, mentor, team)][0].Start = 1 if self.assignment[i] == j else 0
+		temporaryConstraints = []
+		for i, j in fixedPairs:
+			temporaryConstraints.append(m.addConstr(problem.varByPair[(1, self.mentors[i], self.teams[j])][0] == 1))
+		for i1, i2 in togetherPairs:
+			for team in self.teams:
+				temporaryConstraints.append(m.addConstr(problem.varByPair[(1, self.mentors[i1], team)][0] == problem.varByPair[(1, self.mentors[i2], team)][0]))
+		oldTimeLimit = m.Params.TimeLimit
+		if timeLimit is not None:
+			m.Params.TimeLimit = timeLimit
+		try:
+			m.optimize()
+			if m.SolCount == 0:
+				if m.Status in [gp.GRB.Status.INFEASIBLE, gp.GRB.Status.INF_OR_UNBD]:
+					return WhatIfResult(None, [], None)
+				return WhatIfResult(None, [], "re-solve", assign.solverStatusNames[m.Status]) # eg the time limit ran out first
+			moves = {}
+			for i, mentor in enumerate(self.mentors):
+				for j, team in enumerate(self.teams):
+					if problem.varByPair[(1, mentor, team)][0].X > 0.5:
+						moves[i] = j
+		finally:
+			# put the model back the way it was for the next query
+			for constraint in temporaryConstraints:
+				m.remove(constraint)
+			m.Params.TimeLimit = oldTimeLimit
+			m.update()
+		moves = {i: j for i, j in moves.items() if self.assignment[i] != j}
+		delta = self.evaluateMoves(moves) if moves else 0
+		return WhatIfResult(delta, self.describeMoves(moves), "re-solve")
+
+	def move(self, mentor, team, timeLimit = None):
+		"""
+		What happens if mentor is assigned to team?
+		"""
+		i, j = self.mentorIndex[mentor], self.teamIndex[team]
+		if self.assignment[i] == j:
+			return WhatIfResult(0, [], "local")
+		repaired = self.repairMoves({i: j})
+		if repaired is not None:
+			return WhatIfResult(repaired[0], self.describeMoves(repaired[1]), "local")
+		return self.resolve([(i, j)], [], timeLimit)
+
+	def swap(self, mentor1, mentor2):
+		"""
+		What happens if mentor1 and mentor2 trade teams?
+		"""
+		i1, i2 = self.mentorIndex[mentor1], self.mentorIndex[mentor2]
+		if self.assignment[i1] == self.assignment[i2]:
+			return WhatIfResult(0, [], "local")
+		moves = {i1: self.assignment[i2], i2: self.assignment[i1]}
+		return WhatIfResult(self.evaluateMoves(moves), self.describeMoves(moves), "local")
+
+	def keepTogether(self, mentor1, mentor2, timeLimit = None):
+		"""
+		What happens if mentor1 and mentor2 have to be on the same team?
+		"""
+		i1, i2 = self.mentorIndex[mentor1], self.mentorIndex[mentor2]
+		if self.assignment[i1] == self.assignment[i2]:
+			return WhatIfResult(0, [], "local")
+		# either mentor can join the other's team; the one staying put is listed too, so the repair can't move them away
+		best = None
+		for moves in [{i1: self.assignment[i1], i2: self.assignment[i1]}, {i1: self.assignment[i2], i2: self.assignment[i2]}]:
+			repaired = self.repairMoves(moves)
+			if repaired is not None and (best is None or repaired[0] > best[0]):
+				best = repaired
+		if best is not None:
+			return WhatIfResult(best[0], self.describeMoves(best[1]), "local")
+		return self.resolve([], [(i1, i2)], timeLimit)
+
+	def apply(self, result):
+		"""
+		Makes the changes in a WhatIfResult to the current matching, so later queries build on it
+		"""
+		for mentor, oldTeam, newTeam in result.changes:
+			i, oldJ, newJ = self.mentorIndex[mentor], self.teamIndex[oldTeam], self.teamIndex[newTeam]
+			self.members[oldJ].remove(i)
+			self.members[newJ].add(i)
+			self.assignment[i] = newJ
+
+	def getMatching(self):
+		"""
+		Returns the current matching as a map from mentor to team
+		"""
+		return {mentor: self.teams[self.assignment[i]] for i, mentor in enumerate(self.mentors)}
+
+
+def findByName(people, name):
+	"""
+	Returns the mentor / team in people matching name; raises a ValueError if there isn't one
+	"""
+	for person in people:
+		if person.isMatch(name):
+			return person
+	raise ValueError("Could not find " + name)
+
+def main(argv = None):
+	"""
+	Command line entry point; returns the process exit code
+	"""
+	parser = argparse.ArgumentParser(description = "See how a matching changes if a mentor is moved or mentors are kept together.")
+	parser.add_argument("--mentors", default = "mentors.csv", help = "mentor data file (default: mentors.csv)")
+	parser.add_argument("--teams", default = "teams.csv", help = "team data file (default: teams.csv)")
+	parser.add_argument("--matching", default = "matching.csv", help = "current matching, in the format assign.py writes (default: matching.csv)")
+	parser.add_argument("--candidates", type = int, metavar = "K", help = "only model the K most promising co-mentors (see candidates.py)")
+	parser.add_argument("--time-limit", type = float, help = "time limit in seconds for any re-solve")
+	parser.add_argument("--move", nargs = 2, action = "append", default = [], metavar = ("MENTOR", "TEAM"), help = "move MENTOR to TEAM")
+	parser.add_argument("--swap", nargs = 2, action = "append", default = [], metavar = ("MENTOR1", "MENTOR2"), help = "swap the teams of two mentors")
+	parser.add_argument("--together", nargs = 2, action = "append", default = [], metavar = ("MENTOR1", "MENTOR2"), help = "put two mentors on the same team")
+	args = parser.parse_args(sys.argv[1:] if argv is None else argv)
+
+	mentors, teams = assign.loadData(args.mentors, args.teams)
+	candidateGroups = None
+	if args.candidates is not None:
+		import candidates
+		candidateGroups = candidates.getCandidateGroups(mentors, teams, args.candidates)
+	scores = assign.computeScores(mentors, teams, includeGroups = False) # group scores are computed by WhatIf as needed
+	whatIf = WhatIf(mentors, teams, scores, assign.readMatching(args.matching, mentors, teams), candidateGroups = candidateGroups)
+
+	for mentorName, teamName in args.move:
+		print("Moving " + mentorName + " to " + teamName + ":")
+		print(whatIf.move(findByName(mentors, mentorName), findByName(teams, teamName), args.time_limit).describe())
+	for mentorName1, mentorName2 in args.swap:
+		print("Swapping " + mentorName1 + " and " + mentorName2 + ":")
+		print(whatIf.swap(findByName(mentors, mentorName1), findByName(mentors, mentorName2)).describe())
+	for mentorName1, mentorName2 in args.together:
+		print("Keeping " + mentorName1 + " and " + mentorName2 + " together:")
+		print(whatIf.keepTogether(findByName(mentors, mentorName1), findByName(mentors, mentorName2), args.time_limit).describe())
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())